@@ -1,27 +1,36 @@
 # app.py – Türkiye AQI Dashboard (Multi‑City) – Gauge UI v2
 from __future__ import annotations
 
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, cast
+from typing import TYPE_CHECKING
 
-import folium
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import numpy as np
 import streamlit as st
 from streamlit_extras.metric_cards import style_metric_cards
-from streamlit_folium import st_folium
 
 from aqi_client import _get_token, fetch_aqi
 
+# Plotly and Folium are imported lazily inside the chart / map helpers, keeping
+# their import-time setup off the path to the first KPI cards.
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
 # ------------------------------------------------------------------
 # Config
 # ------------------------------------------------------------------
 TOKEN = _get_token()
+# WAQI publishes on a ~10 min cadence. Cached readings expire when the next
+# bucket after their timestamp is due (see _expired), so they are never kept
+# longer than CACHE_TTL and never refetched sooner than MIN_REFRESH. Expiry is
+# checked against the stored fetch time rather than Streamlit's ttl, so the
+# fetch caches can persist to disk and survive restarts.
 CACHE_TTL = 600  # 10 dk
+MIN_REFRESH = 60  # 1 dk
+HISTORY_MAX = 288  # 24 saat @ 5 dk
 
-CITY_MAP: Dict[str, str] = {
+CITY_MAP: dict[str, str] = {
     "Antalya": "antalya",
     "Muğla": "mugla",
     "İstanbul": "istanbul",
@@ -42,44 +51,174 @@ COLORS = [
     (301, 500, "#7e0023", "Tehlikeli"),
 ]
 
+PAGE_CSS = """
+    <style>
+    section[data-testid="stSidebar"] {background:#f4f7fb;padding-top:1.2rem;width:235px !important;}
+    .sidebar-title {font-size:1.2rem;font-weight:600;margin-bottom:0.6rem;}
+    .sidebar-label {color:#6c6c6c;font-size:0.85rem;margin:0;}
+    .sidebar-value {font-weight:600;margin-bottom:0.8rem;}
+    main > div.block-container {padding-top:0.5rem;padding-bottom:0rem;}
+    h1,h2,h3 {margin-top:0.25rem;margin-bottom:0.6rem;}
+    </style>
+    """
+
 # ------------------------------------------------------------------
 # Helpers
 # ------------------------------------------------------------------
 
+# Bucket upper bounds and colours, derived once from COLORS for bisect lookup
+_THRESHOLDS = tuple(high for _, high, _, _ in COLORS[:-1])
+_BUCKET_COLORS = tuple(clr for _, _, clr, _ in COLORS)
+
+# Gauge bands and legend markup are static, so build them once at import
+_STEPS_CFG = [{"range": [low, high], "color": clr} for low, high, clr, _ in COLORS]
+
+def _build_legend_html() -> str:
+    legend_html = "<div style='display:flex;flex-wrap:wrap;gap:12px;font-size:0.75rem;'>"
+    for low, high, clr, name in COLORS:
+        rng = f"{low}-{high}" if high < 500 else f"{low}+"
+        legend_html += (
+            f"<span style='display:flex;align-items:center;'>"
+            f"<span style='width:12px;height:12px;background:{clr};display:inline-block;margin-right:4px;border-radius:2px;'></span>"
+            f"{name} ({rng})"
+            "</span>"
+        )
+    legend_html += "</div>"
+    return legend_html
+
+_LEGEND_HTML = _build_legend_html()
+
 def aqi_color(val: int) -> str:
-    for low, high, clr, _ in COLORS:
-        if low <= val <= high:
-            return clr
-    return "#7e0023"
+    return _BUCKET_COLORS[bisect_left(_THRESHOLDS, val)]
+
+LiveData = tuple[datetime, int, dict[str, float], float, float]
 
-@st.cache_data(ttl=CACHE_TTL)
-def fetch_live(city_id: str) -> tuple[datetime, int, Dict[str, float], float, float]:
+def _load_live(city_id: str) -> LiveData:
     raw = fetch_aqi(city_id, TOKEN)
-    ts = datetime.fromtimestamp(raw["data"]["time"]["v"])
-    aqi_val = raw["data"]["aqi"]
-    comps = {k.upper(): v["v"] for k, v in raw["data"].get("iaqi", {}).items()}
-    lat, lon = raw["data"]["city"]["geo"]
+    ts = datetime.fromtimestamp(raw["ts"])
+    aqi_val = raw["aqi"]
+    comps = {k.upper(): v for k, v in raw["iaqi"].items()}
+    lat, lon = raw["geo"]
     return ts, aqi_val, comps, lat, lon
 
+def _expired(ts: datetime, fetched_at: datetime) -> bool:
+    """True once WAQI's next update after *ts* is due (bounded staleness)."""
+    age = (fetched_at - ts).total_seconds()
+    ttl = max(MIN_REFRESH, CACHE_TTL - age % CACHE_TTL)
+    return (datetime.now() - fetched_at).total_seconds() >= ttl
+
+# (fetched_at, reading); the reading is the error message when the fetch failed
+LiveEntry = tuple[datetime, LiveData | str]
+
+def _entry_expired(entry: LiveEntry) -> bool:
+    fetched_at, live = entry
+    if isinstance(live, str):  # failed city: retry, but no more often than MIN_REFRESH
+        return (datetime.now() - fetched_at).total_seconds() >= MIN_REFRESH
+    return _expired(live[0], fetched_at)
+
+@st.cache_data(ttl=None, persist="disk", show_spinner=False)
+def _fetch_entry(city_id: str) -> LiveEntry:
+    try:
+        return datetime.now(), _load_live(city_id)
+    except Exception as exc:  # pylint: disable=broad-except
+        return datetime.now(), str(exc)
+
+def _live_entry(city_id: str) -> LiveEntry:
+    entry = _fetch_entry(city_id)
+    if _entry_expired(entry):
+        _fetch_entry.clear(city_id)
+        entry = _fetch_entry(city_id)
+    return entry
+
+@st.cache_resource
+def _fetch_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=8)
+
+def fetch_live(city_id: str) -> LiveData:
+    _, live = _live_entry(city_id)
+    if isinstance(live, str):
+        raise RuntimeError(live)
+    return live
+
+def fetch_all(city_ids: tuple[str, ...]) -> dict[str, LiveData | str]:
+    """Fetch every city concurrently; a failed city maps to its error message.
+
+    Each city is its own cache entry with its own fetch time, so only cities
+    whose next WAQI update is due hit the network; the rest are cache hits.
+    """
+    entries = _fetch_pool().map(_live_entry, city_ids)
+    return {cid: live for cid, (_, live) in zip(city_ids, entries)}
+
+# Figures are cached per input and treated as read-only afterwards, so
+# reruns with unchanged data skip Plotly's figure/layout construction.
+@st.cache_resource(max_entries=64)
+def gauge_figure(aqi: int) -> go.Figure:
+    import plotly.graph_objects as go
+
+    # Simple semicircle gauge using Plotly Indicator
+    gauge_fig = go.Figure(
+        go.Indicator(
+            mode="gauge+number",
+            value=aqi,
+            number={"font": {"size": 36}},
+            gauge={
+                "axis": {"range": [None, 500]},
+                "bar": {"color": aqi_color(aqi)},
+                "steps": _STEPS_CFG,
+            },
+        )
+    )
+    gauge_fig.update_layout(margin=dict(l=20, r=20, t=10, b=10), height=250)
+    return gauge_fig
+
+@st.cache_resource(max_entries=64)
+def components_figure(comps: dict[str, float]) -> go.Figure:
+    import plotly.express as px
+
+    comp_df = (
+        pd.Series(comps, name="Val", dtype="float64")
+        .sort_values(ascending=False)
+        .rename_axis("Cmp")
+        .reset_index()
+    )
+    bar_fig = px.bar(comp_df, x="Cmp", y="Val", color="Val", color_continuous_scale="thermal")
+    bar_fig.update_layout(coloraxis_showscale=False, yaxis_title=None,
+                          plot_bgcolor="rgba(0,0,0,0)")
+    return bar_fig
+
+@st.cache_resource(ttl=86400, max_entries=128)
+def station_map_html(city_name: str, lat: float, lon: float, aqi: int) -> str:
+    """Standalone Leaflet page for the station marker (cached per reading)."""
+    import folium
+
+    map_obj = folium.Map(
+        location=[lat, lon], zoom_start=11, control_scale=True,
+        tiles="CartoDB positron", prefer_canvas=True,
+    )
+    folium.CircleMarker(
+        location=[lat, lon], radius=12, color=aqi_color(aqi), fill=True,
+        fill_color=aqi_color(aqi), fill_opacity=0.85, popup=f"{city_name} AQI: {aqi}"
+    ).add_to(map_obj)
+    return map_obj.get_root().render()
+
+def render_station_map(city_name: str, lat: float, lon: float, aqi: int) -> None:
+    # Nothing reads map state back, so a one-way HTML component is enough and
+    # skips st_folium's two-way Leaflet <-> Python bridge on every rerun.
+    from streamlit.components.v1 import html
+
+    html(station_map_html(city_name, lat, lon, aqi), height=550)
+
 # ------------------------------------------------------------------
 # Page & CSS
 # ------------------------------------------------------------------
 
 st.set_page_config(page_title="Türkiye AQI Dashboard", page_icon="🌬️", layout="wide")
 
-st.markdown(
-    """
-    <style>
-    section[data-testid="stSidebar"] {background:#f4f7fb;padding-top:1.2rem;width:235px !important;}
-    .sidebar-title {font-size:1.2rem;font-weight:600;margin-bottom:0.6rem;}
-    .sidebar-label {color:#6c6c6c;font-size:0.85rem;margin:0;}
-    .sidebar-value {font-weight:600;margin-bottom:0.8rem;}
-    main > div.block-container {padding-top:0.5rem;padding-bottom:0rem;}
-    h1,h2,h3 {margin-top:0.25rem;margin-bottom:0.6rem;}
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+# Streamlit clears elements a rerun does not re-emit, so styles are sent on
+# every run; a once-per-session guard would unstyle the page after the first
+# interaction.
+st.markdown(PAGE_CSS, unsafe_allow_html=True)
+style_metric_cards(background_color="#FFFFFF22", border_size_px=0.5, box_shadow=True)
 
 # ------------------------------------------------------------------
 # Sidebar & data fetch
@@ -90,7 +229,14 @@ with st.sidebar:
     city_id = CITY_MAP[city_name]
 
 try:
-    ts, aqi, comps, lat, lon = fetch_live(city_id)
+    # All cities are warmed in one parallel batch. A failed city keeps its
+    # error until its retry is due, so reruns don't re-hit a failing API.
+    live = fetch_all(tuple(CITY_MAP.values())).get(city_id)
+    if live is None:  # not part of the batch at all
+        live = fetch_live(city_id)
+    if isinstance(live, str):
+        raise RuntimeError(live)
+    ts, aqi, comps, lat, lon = live
 except Exception as e:
     st.error(f"API hatası: {e}")
     st.stop()
@@ -106,13 +252,28 @@ with st.sidebar:
 # ------------------------------------------------------------------
 key_hist = f"history_{city_id}"
 if key_hist not in st.session_state:
-    st.session_state[key_hist] = []  # type: ignore[assignment]
-history: List[Dict[str, int]] = cast(List[Dict[str, int]], st.session_state[key_hist])
-if not history or history[-1]["ts"] != ts:
-    history.append({"ts": ts, "aqi": aqi})
-
-hist_df = pd.DataFrame(history)
-hist_df["ts"] = pd.to_datetime(hist_df["ts"])
+    st.session_state[key_hist] = pd.DataFrame(
+        {"ts": pd.Series(dtype="datetime64[ns]"), "aqi": pd.Series(dtype="int64")}
+    )
+hist_df: pd.DataFrame = st.session_state[key_hist]
+# Append in place instead of rebuilding the frame from a list each rerun; a
+# repeated timestamp is the same reading (cache hit or a WAQI revision), so
+# it only refreshes the last row's value
+if not hist_df.empty and hist_df["ts"].iloc[-1] == ts:
+    if hist_df["aqi"].iloc[-1] != aqi:
+        hist_df.iat[-1, hist_df.columns.get_loc("aqi")] = aqi
+else:
+    hist_df.loc[len(hist_df)] = (ts, aqi)
+    # Drop readings older than 24 h (relative to the newest one, so a lagging
+    # station keeps its history) and cap the length ring-buffer style; ts is
+    # sorted, so the cutoff is a binary search rather than a boolean mask
+    start = max(
+        int(hist_df["ts"].searchsorted(ts - timedelta(hours=24))),
+        len(hist_df) - HISTORY_MAX,
+    )
+    if start > 0:
+        hist_df = hist_df.iloc[start:].reset_index(drop=True)
+        st.session_state[key_hist] = hist_df
 # --- flat fill for first visit
 if len(hist_df) < 2:
     rng = pd.date_range(end=ts, periods=24, freq="h")
@@ -125,7 +286,6 @@ col_aqi, col_pm25, col_pm10 = st.columns(3)
 col_aqi.metric("AQI", aqi)
 col_pm25.metric("PM 2.5", f"{comps.get('PM2.5', 0):.1f}")
 col_pm10.metric("PM 10", f"{comps.get('PM10', 0):.1f}")
-style_metric_cards(background_color="#FFFFFF22", border_size_px=0.5, box_shadow=True)
 
 # ------------------------------------------------------------------
 # Gauge + Bar charts
@@ -136,44 +296,15 @@ chart_col, bar_col = st.columns([1.2, 1])
 with chart_col:
     st.subheader("AQI Seviye Göstergesi")
 
-    # Simple semicircle gauge using Plotly Indicator
-    steps_cfg = [{"range": [low, high], "color": clr} for low, high, clr, _ in COLORS]
-    gauge_fig = go.Figure(
-        go.Indicator(
-            mode="gauge+number",
-            value=aqi,
-            number={"font": {"size": 36}},
-            gauge={
-                "axis": {"range": [None, 500]},
-                "bar": {"color": aqi_color(aqi)},
-                "steps": steps_cfg,
-            },
-        )
-    )
-    gauge_fig.update_layout(margin=dict(l=20, r=20, t=10, b=10), height=250)
-    st.plotly_chart(gauge_fig, use_container_width=True)
+    st.plotly_chart(gauge_figure(aqi), use_container_width=True)
 
     # Legend under gauge
-    legend_html = "<div style='display:flex;flex-wrap:wrap;gap:12px;font-size:0.75rem;'>"
-    for low, high, clr, name in COLORS:
-        rng = f"{low}-{high}" if high < 500 else f"{low}+"
-        legend_html += (
-            f"<span style='display:flex;align-items:center;'>"
-            f"<span style='width:12px;height:12px;background:{clr};display:inline-block;margin-right:4px;border-radius:2px;'></span>"
-            f"{name} ({rng})"
-            "</span>"
-        )
-    legend_html += "</div>"
-    st.markdown(legend_html, unsafe_allow_html=True)
+    st.markdown(_LEGEND_HTML, unsafe_allow_html=True)
 
 # ---------- Components bar ---------- ----------
 with bar_col:
     st.subheader("Bileşen Dağılımı (µg/m³)")
-    comp_df = pd.DataFrame(comps.items(), columns=["Cmp", "Val"]).sort_values("Val", ascending=False)
-    bar_fig = px.bar(comp_df, x="Cmp", y="Val", color="Val", color_continuous_scale="thermal")
-    bar_fig.update_layout(coloraxis_showscale=False, yaxis_title=None,
-                          plot_bgcolor="rgba(0,0,0,0)")
-    st.plotly_chart(bar_fig, use_container_width=True)
+    st.plotly_chart(components_figure(comps), use_container_width=True)
 
 # ------------------------------------------------------------------
 # Map
@@ -181,10 +312,4 @@ with bar_col:
 # ------------------------------------------------------------------
 
 st.markdown("### 🗺️ İstasyon Konumu")
-map_obj = folium.Map(location=[lat, lon], zoom_start=11, control_scale=True)
-folium.CircleMarker(
-    location=[lat, lon], radius=12, color=aqi_color(aqi), fill=True,
-    fill_color=aqi_color(aqi), fill_opacity=0.85, popup=f"{city_name} AQI: {aqi}"
-).add_to(map_obj)
-
-st_folium(map_obj, height=550, width="100%")
+render_station_map(city_name, lat, lon, aqi)
@@ -6,15 +6,43 @@ from __future__ import annotations
 
 import os
 import sys
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 API_ROOT = "https://api.waqi.info/feed/{}/?token={}"  # WAQI endpoint
 
+# Shared keep-alive session so repeated fetches reuse the TLS connection
+_SESSION = requests.Session()
+_SESSION.headers.update({"Accept-Encoding": "gzip"})
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    ),
+)
+
+# city -> (conditional request headers, last pruned payload); only filled when
+# WAQI sends ETag / Last-Modified, otherwise requests stay unconditional
+_ETAGS: Dict[str, Tuple[Dict[str, str], Dict[str, Any]]] = {}
+
 
 def fetch_aqi(city: str, token: str) -> Dict[str, Any]:
-    """Return WAQI JSON for given *city* (or station id).
+    """Return the WAQI reading for given *city* (or station id).
+
+    Only the fields the dashboard uses are kept (``forecast`` and the rest of
+    the feed are dropped)::
+
+        {"ts": <unix time>, "aqi": int, "iaqi": {"pm25": float, ...},
+         "geo": [lat, lon]}
+
+    Repeat calls send ``If-None-Match`` / ``If-Modified-Since`` when WAQI
+    supplied validators, and a ``304`` reuses the previously returned reading.
 
     Parameters
     ----------
@@ -29,14 +57,33 @@ def fetch_aqi(city: str, token: str) -> Dict[str, Any]:
         If WAQI responds with a non-"ok" status.
     """
     url = API_ROOT.format(city, token)
-    response = requests.get(url, timeout=10)
+    cached = _ETAGS.get(city)
+    response = _SESSION.get(url, timeout=10, headers=cached[0] if cached else None)
+    if response.status_code == 304 and cached:
+        return cached[1]
     response.raise_for_status()
-    data: Dict[str, Any] = response.json()
+    data: Dict[str, Any] = orjson.loads(response.content)
 
     if data["status"] != "ok":
         raise RuntimeError(str(data.get("data")))
 
-    return data
+    feed = data["data"]
+    reading: Dict[str, Any] = {
+        "ts": feed["time"]["v"],
+        "aqi": feed["aqi"],
+        "iaqi": {k: v["v"] for k, v in feed.get("iaqi", {}).items()},
+        "geo": feed["city"]["geo"],
+    }
+
+    validators: Dict[str, str] = {}
+    if "ETag" in response.headers:
+        validators["If-None-Match"] = response.headers["ETag"]
+    if "Last-Modified" in response.headers:
+        validators["If-Modified-Since"] = response.headers["Last-Modified"]
+    if validators:
+        _ETAGS[city] = (validators, reading)
+
+    return reading
 
 
 def _get_token() -> str: